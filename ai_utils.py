@@ -1,17 +1,308 @@
+import hashlib
+import json
+import os
+import shelve
+import threading
 import requests
-import re
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import utils
+
+try:
+    import numpy as np
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
 
 LLM_URL = "http://192.168.56.1:1234/v1/chat/completions"
+LLM_MODEL = "qwen2.5-coder-14b"   # matches your local model name
+LLM_ERROR_PREFIX = "Error contacting local LLM"
+
+CHUNK_TOKENS = 1500
+CHUNK_WORKERS = 4
+
+# Keep-alive session so repeated summaries skip the TCP/HTTP handshake
+_SESSION = requests.Session()
+_SESSION.mount("http://", HTTPAdapter(
+    pool_connections=4, pool_maxsize=8,
+    max_retries=Retry(total=2, backoff_factor=0.2),
+))
+
+# -----------------------------------------------------------
+# Summary cache
+#  - exact: sha256 of model/lengths/text, persisted with shelve
+#  - semantic (only if sentence-transformers is installed):
+#    reuse a summary whose text embedding is near-identical
+# -----------------------------------------------------------
+
+SUMMARY_CACHE_PATH = os.path.join(utils.SAVE_DIR, ".summary_cache.db")
+SEMANTIC_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+SEMANTIC_THRESHOLD = 0.92
+
+_SUMMARY_CACHE: dict[str, str] = {}
+_CACHE_LOCK = threading.Lock()
+
+_encoding = None
+_encoding_loaded = False
+
+_embedder = None
+_EMBEDDER_LOCK = threading.Lock()
+_semantic_vectors = None    # (n, dim) array of normalized embeddings
+_semantic_entries = []      # (min_length, max_length, summary) per row
+
+
+class SummaryCancelled(Exception):
+    """Raised when the caller's stop_event is set during summarization."""
+
+
+class StopEvent(threading.Event):
+    """threading.Event whose set() also closes every LLM response still
+    streaming under it, so a read blocked on the socket fails at once."""
+
+    def __init__(self):
+        super().__init__()
+        self._responses = set()
+        self._responses_lock = threading.Lock()
+
+    def register(self, response):
+        with self._responses_lock:
+            self._responses.add(response)
+        if self.is_set():
+            response.close()
+
+    def unregister(self, response):
+        with self._responses_lock:
+            self._responses.discard(response)
+
+    def set(self):
+        super().set()
+        with self._responses_lock:
+            responses = list(self._responses)
+        for response in responses:
+            try:
+                response.close()
+            except Exception:
+                pass
+
+
+def _count_tokens(text):
+    global _encoding, _encoding_loaded
+    # Loaded on first use: get_encoding may download the BPE file, which
+    # must not happen while the GUI imports this module
+    if not _encoding_loaded:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = None
+        _encoding_loaded = True
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return len(text) // 4 + 1   # rough estimate without tiktoken
+
+
+def _split_oversized(para, n, max_tokens):
+    # Cut at the last space inside each window; text without spaces (CJK,
+    # long URLs) is cut by character count. Windows are sized from the
+    # paragraph's chars-per-token, and any piece still over budget is
+    # split again.
+    width = max(1, len(para) * max_tokens // n)
+    pieces, start = [], 0
+    while start < len(para):
+        end = start + width
+        if end < len(para):
+            cut = para.rfind(" ", start + 1, end)
+            if cut > start:
+                end = cut
+        piece = para[start:end].strip()
+        if piece:
+            size = _count_tokens(piece)
+            if size > max_tokens and len(piece) > 1:
+                pieces.extend(_split_oversized(piece, size, max_tokens))
+            else:
+                pieces.append(piece)
+        start = end
+    return pieces
+
+
+def _summary_key(text, min_length, max_length):
+    raw = f"{LLM_MODEL}|{min_length}|{max_length}|{text}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _cache_get(key):
+    with _CACHE_LOCK:
+        if key in _SUMMARY_CACHE:
+            return _SUMMARY_CACHE[key]
+        try:
+            with shelve.open(SUMMARY_CACHE_PATH) as db:
+                summary = db.get(key)
+        except Exception:
+            return None
+        if summary is not None:
+            _SUMMARY_CACHE[key] = summary
+        return summary
+
+
+def _cache_put(key, summary):
+    with _CACHE_LOCK:
+        _SUMMARY_CACHE[key] = summary
+        try:
+            utils.ensure_directory_exists()
+            with shelve.open(SUMMARY_CACHE_PATH) as db:
+                db[key] = summary
+        except Exception:
+            pass  # in-memory cache still works
+
+
+def _article_body(text):
+    # Saved files all start with the same Title/URL/Timestamp header; the
+    # embedding model only sees ~256 word pieces, so skip straight to the body
+    _, marker, body = text.partition("ARTICLE TEXT:\n")
+    return body if marker else text
+
+
+def _embed(text):
+    global _embedder
+    if SentenceTransformer is None:
+        return None
+    # Double-checked so loading the model never holds up _CACHE_LOCK
+    if _embedder is None:
+        with _EMBEDDER_LOCK:
+            if _embedder is None:
+                _embedder = SentenceTransformer(SEMANTIC_MODEL)
+    return _embedder.encode(_article_body(text), normalize_embeddings=True)
+
+
+def _semantic_get(vector, min_length, max_length):
+    if vector is None:
+        return None
+    # Chunk workers call this concurrently; take a consistent snapshot
+    with _CACHE_LOCK:
+        vectors = _semantic_vectors
+        entries = list(_semantic_entries)
+    if vectors is None:
+        return None
+    # Vectors are normalized, so the dot product is the cosine similarity
+    scores = vectors @ vector
+    for i in np.argsort(scores)[::-1]:
+        if scores[i] < SEMANTIC_THRESHOLD:
+            break
+        lo, hi, summary = entries[i]
+        if (lo, hi) == (min_length, max_length):
+            return summary
+    return None
+
+
+def _semantic_put(vector, min_length, max_length, summary):
+    global _semantic_vectors
+    if vector is None:
+        return
+    with _CACHE_LOCK:
+        row = vector.reshape(1, -1)
+        # Entry first, so a row never exists without its entry
+        _semantic_entries.append((min_length, max_length, summary))
+        _semantic_vectors = row if _semantic_vectors is None else np.vstack([_semantic_vectors, row])
 
 
 # -----------------------------------------------------------
 # Local LLM summarizer using llama.cpp / LLM-Studio
 # -----------------------------------------------------------
 
-def advanced_ai_summary(text, min_length=30, max_length=120):
-    if len(text) < 100:
-        return "Text too short to summarize."
+def _split_chunks(text, max_tokens=CHUNK_TOKENS):
+    # Scraped files keep one paragraph per line; pack lines into chunks
+    # and break any single oversized paragraph into smaller pieces.
+    chunks, current, size = [], [], 0
+
+    def flush():
+        nonlocal current, size
+        if current:
+            chunks.append("\n".join(current))
+        current, size = [], 0
+
+    for para in text.split("\n"):
+        if not para.strip():
+            continue
+        n = _count_tokens(para)
+        if n > max_tokens:
+            flush()
+            chunks.extend(_split_oversized(para, n, max_tokens))
+            continue
+        if size + n > max_tokens:
+            flush()
+        current.append(para)
+        size += n
+    flush()
+    return chunks
+
+
+def _stream_completion(payload, on_token=None, stop_event=None):
+    # Read the OpenAI-style SSE stream ("data: {...}" lines) token by token
+    parts = []
+    trackable = isinstance(stop_event, StopEvent)
+    with _SESSION.post(LLM_URL, json=payload, timeout=(5, 300), stream=True) as response:
+        # Let stop_event.set() close this response from another thread
+        if trackable:
+            stop_event.register(response)
+        try:
+            response.raise_for_status()
+            if "application/json" in response.headers.get("Content-Type", ""):
+                # Server ignored "stream": true and sent one plain completion
+                content = response.json()["choices"][0]["message"]["content"].strip()
+                if content and on_token:
+                    on_token(content)
+                return content
+            for line in response.iter_lines():
+                if stop_event is not None and stop_event.is_set():
+                    raise SummaryCancelled()
+                if not line.startswith(b"data:"):
+                    continue
+                data = line[5:].strip()
+                if data == b"[DONE]":
+                    break
+                delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                if delta:
+                    parts.append(delta)
+                    if on_token:
+                        on_token(delta)
+        except SummaryCancelled:
+            raise
+        except Exception as e:
+            # A read failing because stop() closed the response is a cancel
+            if stop_event is not None and stop_event.is_set():
+                raise SummaryCancelled() from e
+            raise
+        finally:
+            if trackable:
+                stop_event.unregister(response)
+    # A closed response can also just end the stream early
+    if stop_event is not None and stop_event.is_set():
+        raise SummaryCancelled()
+    return "".join(parts).strip()
+
+
+def _summarize(text, min_length, max_length, on_token=None, stop_event=None):
+    # One (cached) LLM call; raises on transport/response errors
+    if stop_event is not None and stop_event.is_set():
+        raise SummaryCancelled()
+
+    key = _summary_key(text, min_length, max_length)
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached
+
+    try:
+        vector = _embed(text)
+    except Exception:
+        vector = None
+    # Semantic hits are approximate; never promote them to the exact cache
+    cached = _semantic_get(vector, min_length, max_length)
+    if cached is not None:
+        return cached
 
     prompt = f"""
 Summarize the following text clearly and concisely.
@@ -22,22 +313,58 @@ Text:
 """
 
     payload = {
-        "model": "qwen2.5-coder-14b",   # matches your local model name
+        "model": LLM_MODEL,
         "messages": [
             {"role": "user", "content": prompt}
         ],
         "temperature": 0.2,
-        "max_tokens": 512
+        "max_tokens": 512,
+        "stream": True
     }
 
+    summary = _stream_completion(payload, on_token=on_token, stop_event=stop_event)
+    if not summary:
+        # Never cache this; advanced_ai_summary reports it as an LLM error
+        raise ValueError("LLM returned an empty summary")
+
+    _cache_put(key, summary)
+    _semantic_put(vector, min_length, max_length, summary)
+    return summary
+
+
+def advanced_ai_summary(text, min_length=30, max_length=120, on_token=None, stop_event=None):
+    # on_token receives the final summary piece by piece as it streams in;
+    # setting stop_event aborts generation with SummaryCancelled. Pass a
+    # StopEvent to also close in-flight responses, including every chunk
+    # request of the map phase.
+    if len(text) < 100:
+        return "Text too short to summarize."
+
     try:
-        response = requests.post(LLM_URL, json=payload)
-        data = response.json()
+        # Map-reduce: summarize chunks in parallel, then summarize the
+        # summaries until everything fits in a single prompt
+        chunks = _split_chunks(text)
+        while len(chunks) > 1:
+            with ThreadPoolExecutor(max_workers=CHUNK_WORKERS) as executor:
+                partials = list(executor.map(
+                    lambda chunk: _summarize(chunk, min_length, max_length, stop_event=stop_event),
+                    chunks
+                ))
+            text = "\n".join(partials)
+            next_chunks = _split_chunks(text)
+            if len(next_chunks) >= len(chunks):
+                break  # not shrinking any more; summarize what we have
+            chunks = next_chunks
 
-        return data["choices"][0]["message"]["content"].strip()
+        return _summarize(text, min_length, max_length,
+                          on_token=on_token, stop_event=stop_event)
 
+    except SummaryCancelled:
+        raise
     except Exception as e:
-        return f"Error contacting local LLM: {e}"
+        if stop_event is not None and stop_event.is_set():
+            raise SummaryCancelled() from e
+        return f"{LLM_ERROR_PREFIX}: {e}"
 
 
 # -----------------------------------------------------------
@@ -47,18 +374,19 @@ Text:
 positive_words = {"good", "great", "excellent", "positive", "happy", "success", "benefit"}
 negative_words = {"bad", "terrible", "sad", "negative", "failure", "harm", "angry"}
 
+POS = frozenset(positive_words)
+NEG = frozenset(negative_words)
+
+def sentiment_from_counts(counts):
+    # Only the (small) vocab sets are looked up, whatever the text size
+    return sum(counts[w] for w in POS) - sum(counts[w] for w in NEG)
+
 def sentiment_weight(text):
-    words = re.findall(r"\b\w+\b", text.lower())
-    score = 0
-    for w in words:
-        if w in positive_words:
-            score += 1
-        elif w in negative_words:
-            score -= 1
-    return score
-
-def sentiment_details(text):
-    score = sentiment_weight(text)
+    return sentiment_from_counts(Counter(utils.tokenize(text)))
+
+def sentiment_details(text, counts=None):
+    # counts: a precomputed token Counter (e.g. utils.build_token_index)
+    score = sentiment_from_counts(counts) if counts is not None else sentiment_weight(text)
     if score > 3:
         mood = "Strongly Positive"
     elif score > 0:
@@ -76,7 +404,9 @@ def sentiment_details(text):
 # Keyword extraction (GUI uses this)
 # -----------------------------------------------------------
 
-def keyword_density(text, top_n=5):
-    words = re.findall(r"\b[a-zA-Z]{3,}\b", text.lower())
-    freq = Counter(words)
+def keyword_density(text, top_n=5, counts=None):
+    # counts: precomputed token Counter (e.g. utils.build_token_index)
+    if counts is None:
+        counts = Counter(utils.tokenize(text))
+    freq = Counter({w: c for w, c in counts.items() if len(w) >= 3})
     return [w for w, c in freq.most_common(top_n)]
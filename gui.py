@@ -11,8 +11,14 @@ Features:
 - Indeterminate progress bar while analysis runs
 """
 
+import functools
+import hashlib
+import html
+import mmap
+import re
 import threading
 import os
+from collections import OrderedDict
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QMainWindow, QLabel, QLineEdit, QPushButton,
     QVBoxLayout, QHBoxLayout, QTextEdit, QTabWidget, QProgressBar,
@@ -27,6 +33,26 @@ import utils        # your utility functions
 import ai_utils     # your AI analysis (LLM-backed summarizer)
 
 
+ANALYSIS_CACHE_SIZE = 64
+ANALYSIS_STOP_TIMEOUT_MS = 3000
+
+# AI analysis card; every field is HTML-escaped before it is filled in
+_RESULT_TMPL = """
+<div>
+    <div><b>File:</b> {file_html}</div>
+    <div style="margin-top:8px;"><b>Sentiment:</b> {sentiment}</div>
+    <div style="margin-top:12px;"><b>Summary:</b><br>{summary_html}</div>
+    <div style="margin-top:12px;"><b>Top Keywords:</b> {keywords_html}</div>
+</div>
+"""
+
+
+@functools.lru_cache(maxsize=512)
+def _keyword_pattern(keyword):
+    # Compiled once per keyword; reused across analyses
+    return re.compile(re.escape(keyword), re.IGNORECASE)
+
+
 class QTextEditLogger(QTextEdit):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -70,12 +96,58 @@ class ScraperThread(QThread):
             self.done_signal.emit(0)
 
 
+# -----------------------
+# Worker thread that scores TXT files for the file table
+# -----------------------
+class TxtScanThread(QThread):
+    row_signal = pyqtSignal(int, str, str)     # scan generation, file name, sentiment score
+
+    def __init__(self, folder, cache, generation, parent=None):
+        super().__init__(parent)
+        self.folder = folder
+        self.generation = generation
+        # path -> (mtime, size, score); shared with the GUI so unchanged
+        # files are never re-read on later refreshes
+        self.cache = cache
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        if not os.path.isdir(self.folder):
+            return
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if self._stop_event.is_set():
+                    return
+                if not entry.name.endswith(".txt") or not entry.is_file():
+                    continue
+                try:
+                    st = entry.stat()
+                    cached = self.cache.get(entry.path)
+                    if cached and cached[:2] == (st.st_mtime, st.st_size):
+                        score = cached[2]
+                    else:
+                        # Score from the file's token index sidecar, which
+                        # persists across restarts and is shared with the AI tab
+                        score = ai_utils.sentiment_from_counts(
+                            utils.build_token_index(entry.path)
+                        )
+                        self.cache[entry.path] = (st.st_mtime, st.st_size, score)
+                    sentiment = str(score)
+                except Exception:
+                    sentiment = 'N/A'
+                self.row_signal.emit(self.generation, entry.name, sentiment)
+
+
 # -----------------------
 # Worker thread for AI analysis (non-blocking)
 # -----------------------
 class AnalysisThread(QThread):
     # Signals to communicate back to GUI
     result_signal = pyqtSignal(str)        # emits HTML result
+    partial_signal = pyqtSignal(str)       # summary text as it streams in
     error_signal = pyqtSignal(str)         # error message
     finished_signal = pyqtSignal()         # finished (successful or not)
 
@@ -84,9 +156,12 @@ class AnalysisThread(QThread):
         self.file_path = file_path
         self.min_length = min_length
         self.max_length = max_length
-        self._stop_event = threading.Event()
+        self.summary_ok = False            # False if the LLM call failed
+        self._stop_event = ai_utils.StopEvent()
 
     def stop(self):
+        # Closes every in-flight LLM response, so even a read still waiting
+        # for the first token fails immediately
         self._stop_event.set()
 
     def run(self):
@@ -105,24 +180,33 @@ class AnalysisThread(QThread):
                 self.finished_signal.emit()
                 return
 
+            # Tokenize once; sentiment and keyword density share the counts
+            try:
+                counts = utils.build_token_index(self.file_path)
+            except Exception:
+                counts = None
+
             # Call ai_utils functions (these may be network/LLM calls)
             try:
-                sentiment = ai_utils.sentiment_details(text)
+                sentiment = ai_utils.sentiment_details(text, counts=counts)
             except Exception as e:
                 # If sentiment fails, continue but note the error
                 sentiment = f"Sentiment error: {e}"
 
             try:
                 summary = ai_utils.advanced_ai_summary(
-                    text, min_length=self.min_length, max_length=self.max_length
+                    text, min_length=self.min_length, max_length=self.max_length,
+                    on_token=self.partial_signal.emit, stop_event=self._stop_event
                 )
+            except ai_utils.SummaryCancelled:
+                return
             except Exception as e:
                 self.error_signal.emit(f"Summary generation failed: {e}")
                 self.finished_signal.emit()
                 return
 
             try:
-                keywords = ai_utils.keyword_density(text, top_n=5)
+                keywords = ai_utils.keyword_density(text, top_n=5, counts=counts)
             except Exception:
                 keywords = []
 
@@ -133,50 +217,38 @@ class AnalysisThread(QThread):
             # Protect against None summary
             if summary is None:
                 summary = ""
+            self.summary_ok = not summary.startswith(ai_utils.LLM_ERROR_PREFIX)
 
             # Highlight first occurrence of top_keyword in the summary (green)
-            if top_keyword:
-                # Only replace the first plain-text occurrence.
-                # Use a simple approach — if summary contains the keyword as-is, replace first match.
-                try:
-                    # naive replace (case-sensitive); try case-insensitive fallback
-                    if top_keyword in summary:
-                        summary_html = summary.replace(top_keyword,
-                                                       f'<span style="color:green; font-weight:bold;">{top_keyword}</span>',
-                                                       1)
-                    else:
-                        # case-insensitive replacement: find index
-                        import re
-                        pattern = re.compile(re.escape(top_keyword), re.IGNORECASE)
-                        summary_html = pattern.sub(
-                            lambda m: f'<span style="color:green; font-weight:bold;">{m.group(0)}</span>',
-                            summary,
-                            count=1
-                        )
-                except Exception:
-                    summary_html = summary  # fallback
+            # Match on the raw text and escape around the match, so LLM output
+            # can't inject markup and the keyword never matches inside an entity.
+            m = _keyword_pattern(top_keyword).search(summary) if top_keyword else None
+            if m:
+                summary_html = (
+                    html.escape(summary[:m.start()])
+                    + f'<span style="color:green; font-weight:bold;">{html.escape(m.group(0))}</span>'
+                    + html.escape(summary[m.end():])
+                )
             else:
-                summary_html = summary
+                summary_html = html.escape(summary)
 
             # File name in red
-            file_html = f'<span style="color:red; font-weight:bold;">{file_name}</span>'
+            file_html = f'<span style="color:red; font-weight:bold;">{html.escape(file_name)}</span>'
 
             # Build keywords list HTML
             if keywords:
                 keywords_html = ", ".join(
-                    f'<span style="font-weight:bold;">{k}</span>' for k in keywords
+                    f'<span style="font-weight:bold;">{html.escape(k)}</span>' for k in keywords
                 )
             else:
                 keywords_html = "None"
 
-            result_html = f"""
-            <div>
-                <div><b>File:</b> {file_html}</div>
-                <div style="margin-top:8px;"><b>Sentiment:</b> {sentiment}</div>
-                <div style="margin-top:12px;"><b>Summary:</b><br>{summary_html}</div>
-                <div style="margin-top:12px;"><b>Top Keywords:</b> {keywords_html}</div>
-            </div>
-            """
+            result_html = _RESULT_TMPL.format_map({
+                "file_html": file_html,
+                "sentiment": html.escape(sentiment),
+                "summary_html": summary_html,
+                "keywords_html": keywords_html,
+            })
 
             # Emit the HTML result
             self.result_signal.emit(result_html)
@@ -222,6 +294,10 @@ class MainWindow(QMainWindow):
         self.thread = None
         self.analysis_thread = None
 
+        # (path, sha256 of contents, min, max) -> rendered HTML, LRU-bounded
+        self._analysis_cache = OrderedDict()
+        self._analysis_key = None
+
         # Apply initial font settings to widgets we'll manage
         self.apply_font_settings()
         self.apply_wrap_settings()
@@ -400,22 +476,36 @@ class MainWindow(QMainWindow):
         layout.addWidget(QLabel("Scraped TXT files:"))
         layout.addWidget(self.txt_file_table)
         self.database_tab.setLayout(layout)
+        self._sentiment_cache = {}
+        self.scan_thread = None
+        self._scan_generation = 0
         self.refresh_txt_file_table()
 
     def refresh_txt_file_table(self):
-        folder = utils.SAVE_DIR
-        files = os.listdir(folder) if os.path.exists(folder) else []
-        self.txt_file_table.setRowCount(len(files))
-        for i, fname in enumerate(files):
-            path = os.path.join(folder, fname)
-            try:
-                with open(path, "r", encoding="utf-8") as f:
-                    text = f.read()
-                sentiment = ai_utils.sentiment_weight(text)
-            except Exception:
-                sentiment = 'N/A'
-            self.txt_file_table.setItem(i, 0, QTableWidgetItem(fname))
-            self.txt_file_table.setItem(i, 1, QTableWidgetItem(str(sentiment)))
+        # Scan off the UI thread; rows are appended as they are scored
+        self.stop_txt_scan()
+        # Rows already queued by an older scan carry a stale generation
+        # and are dropped in add_txt_file_row
+        self._scan_generation += 1
+        self.txt_file_table.setRowCount(0)
+        self.scan_thread = TxtScanThread(
+            utils.SAVE_DIR, self._sentiment_cache, self._scan_generation
+        )
+        self.scan_thread.row_signal.connect(self.add_txt_file_row)
+        self.scan_thread.start()
+
+    def stop_txt_scan(self):
+        if self.scan_thread and self.scan_thread.isRunning():
+            self.scan_thread.stop()
+            self.scan_thread.wait()
+
+    def add_txt_file_row(self, generation, fname, sentiment):
+        if generation != self._scan_generation:
+            return
+        row = self.txt_file_table.rowCount()
+        self.txt_file_table.insertRow(row)
+        self.txt_file_table.setItem(row, 0, QTableWidgetItem(fname))
+        self.txt_file_table.setItem(row, 1, QTableWidgetItem(sentiment))
 
     # Keyword Search Tab
     def init_keyword_tab(self):
@@ -439,15 +529,32 @@ class MainWindow(QMainWindow):
         if not keyword:
             self.keyword_search_output.setText("Enter a keyword.")
             return
+        if keyword.isascii():
+            # Match raw UTF-8 bytes through mmap: no decode, no lowercased
+            # copies, and search() stops at the first hit. Bytes patterns only
+            # fold ASCII case, which is all an ASCII keyword needs.
+            pattern = re.compile(re.escape(keyword.encode("utf-8")), re.IGNORECASE)
+        else:
+            # Non-ASCII ("Über") needs Unicode case folding on decoded text
+            pattern = None
+            needle = keyword.casefold()
         files = os.listdir(folder) if os.path.exists(folder) else []
         for fname in files:
+            if not fname.endswith(".txt"):
+                continue  # skip the summary cache and other sidecar files
             path = os.path.join(folder, fname)
             try:
-                with open(path, "r", encoding="utf-8") as f:
-                    text = f.read()
-                if keyword.lower() in text.lower():
+                if pattern is not None:
+                    with open(path, "rb") as f, \
+                            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                        found = pattern.search(mm) is not None
+                else:
+                    with open(path, "r", encoding="utf-8") as f:
+                        found = needle in f.read().casefold()
+                if found:
                     results.append(f"{fname}: FOUND")
             except Exception:
+                # includes empty files, which cannot be mmapped
                 continue
         if results:
             self.keyword_search_output.setText("\n".join(results))
@@ -500,6 +607,21 @@ class MainWindow(QMainWindow):
             self.ai_summary_output.setText("Select a valid TXT file first.")
             return
 
+        min_length, max_length = 60, 200
+
+        # Unchanged file + same settings: reuse the last result, no thread
+        try:
+            with open(file_path, "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+        except OSError as e:
+            self.ai_summary_output.setText(f"Could not read file: {e}")
+            return
+        key = (file_path, digest, min_length, max_length)
+        if key in self._analysis_cache:
+            self._analysis_cache.move_to_end(key)
+            self.handle_analysis_result(self._analysis_cache[key])
+            return
+
         # Disable UI controls while running
         self.analyze_file_button.setEnabled(False)
         self.browse_file_button.setEnabled(False)
@@ -507,12 +629,31 @@ class MainWindow(QMainWindow):
         self.ai_progress.setVisible(True)
 
         # Create and start the analysis thread
-        self.analysis_thread = AnalysisThread(file_path, min_length=60, max_length=200)
-        self.analysis_thread.result_signal.connect(self.handle_analysis_result)
+        self.analysis_thread = AnalysisThread(file_path, min_length=min_length, max_length=max_length)
+        self.analysis_thread.partial_signal.connect(self.handle_analysis_partial)
+        self._analysis_key = key
+        self.analysis_thread.result_signal.connect(self.handle_analysis_done)
         self.analysis_thread.error_signal.connect(self.handle_analysis_error)
         self.analysis_thread.finished_signal.connect(self.handle_analysis_finished)
         self.analysis_thread.start()
 
+    def handle_analysis_done(self, result_html):
+        # Cache successful analyses (not LLM error cards), then render
+        if self.analysis_thread and self.analysis_thread.summary_ok:
+            self.remember_analysis(self._analysis_key, result_html)
+        self.handle_analysis_result(result_html)
+
+    def remember_analysis(self, key, result_html):
+        self._analysis_cache[key] = result_html
+        self._analysis_cache.move_to_end(key)
+        while len(self._analysis_cache) > ANALYSIS_CACHE_SIZE:
+            self._analysis_cache.popitem(last=False)
+
+    def handle_analysis_partial(self, chunk):
+        # Show the summary as it is generated; replaced by the final HTML
+        self.ai_summary_output.moveCursor(QTextCursor.End)
+        self.ai_summary_output.insertPlainText(chunk)
+
     def handle_analysis_result(self, result_html):
         # This is called in the main thread via signal; render HTML
         self.ai_summary_output.setHtml(result_html)
@@ -533,6 +674,16 @@ class MainWindow(QMainWindow):
         if self.analysis_thread and self.analysis_thread.isFinished():
             self.analysis_thread = None
 
+    def closeEvent(self, event):
+        # Don't let worker threads outlive the window
+        self.stop_txt_scan()
+        if self.analysis_thread and self.analysis_thread.isRunning():
+            self.analysis_thread.stop()
+            # Bounded: a request still waiting for response headers has no
+            # response to close yet, so don't let it freeze the window
+            self.analysis_thread.wait(ANALYSIS_STOP_TIMEOUT_MS)
+        super().closeEvent(event)
+
     # Optionally refresh file selector after scraping
     def refresh_file_selector_if_needed(self):
         # If adding/supporting a QComboBox selector, refresh here.
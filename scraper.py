@@ -1,47 +1,130 @@
+import asyncio
+import hashlib
 import os
 import requests
-from bs4 import BeautifulSoup
-from datetime import datetime
-from urllib.parse import urljoin
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from requests.adapters import HTTPAdapter
+from itertools import islice
+from urllib.parse import urljoin, urldefrag, urlsplit
 from PIL import Image
 import pytesseract
 import io
 
-from playwright.sync_api import sync_playwright
+try:
+    from selectolax.parser import HTMLParser
+except ImportError:
+    HTMLParser = None
+    from bs4 import BeautifulSoup
 
-SAVE_DIR = "scraped_txt"
+from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
 
-def get_timestamp():
-    return datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+from utils import SAVE_DIR, safe_filename, get_timestamp, write_text_to_file
 
-def safe_filename(name):
-    return "".join(c if c.isalnum() or c in " -_." else "_" for c in name)[:100]
+MAX_CONCURRENT_PAGES = 8
+PAGE_LIMIT = 50
+MAX_PER_LEVEL = 25
+OCR_WORKERS = 8
+
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+    "AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/120.0.0.0 Safari/537.36"
+)
+
+# Shared session so image downloads reuse pooled keep-alive connections
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=16, pool_maxsize=32))
+SESSION.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=32))
+
+# Background writer so saving a file never holds up the next page
+_IO_POOL = ThreadPoolExecutor(max_workers=2)
 
 # --------------------------------------------------------
-# Playwright: Fetch a fully rendered webpage (JS-enabled)
+# Playwright: Fetch fully rendered webpages (JS-enabled)
+# The browser is launched once per crawl; every fetch only
+# opens (and closes) a page in the shared context.
 # --------------------------------------------------------
-def fetch_page_playwright(url, log_signal=None):
-    try:
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True)
-            page = browser.new_page(
-                user_agent=(
-                    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                    "AppleWebKit/537.36 (KHTML, like Gecko) "
-                    "Chrome/120.0.0.0 Safari/537.36"
-                )
+class PlaywrightPool:
+    def __init__(self, max_pages=MAX_CONCURRENT_PAGES):
+        self.max_pages = max_pages
+        self._playwright = None
+        self._browser = None
+        self._context = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        self._playwright = await async_playwright().start()
+        try:
+            self._browser = await self._playwright.chromium.launch(
+                headless=True, args=["--disable-gpu", "--no-sandbox"]
             )
-            page.goto(url, timeout=60000, wait_until="networkidle")
-            html = page.content()
-            browser.close()
-            return html
+            self._context = await self._browser.new_context(user_agent=USER_AGENT)
+        except Exception:
+            await self._playwright.stop()
+            raise
+        self._semaphore = asyncio.Semaphore(self.max_pages)
+        return self
 
-    except Exception as e:
-        if log_signal:
-            log_signal.emit(f"[ERROR] Playwright fetch failed for {url}: {e}\n")
-        else:
-            print(f"[ERROR] Playwright fetch failed for {url}: {e}")
-        return None
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            await self._browser.close()
+        finally:
+            # Always stop the driver, even if the browser is already gone
+            await self._playwright.stop()
+
+    async def fetch(self, url, log_signal=None):
+        async with self._semaphore:
+            page = None
+            try:
+                page = await self._context.new_page()
+                # Don't wait for network idle (500ms of silence); article
+                # text is usually there as soon as the first <p> renders.
+                await page.goto(url, timeout=60000, wait_until="domcontentloaded")
+                try:
+                    await page.wait_for_selector("p", timeout=3000)
+                except PlaywrightTimeoutError:
+                    pass
+                return await page.content()
+
+            except Exception as e:
+                if log_signal:
+                    log_signal.emit(f"[ERROR] Playwright fetch failed for {url}: {e}\n")
+                else:
+                    print(f"[ERROR] Playwright fetch failed for {url}: {e}")
+                return None
+
+            finally:
+                if page:
+                    try:
+                        await page.close()
+                    except Exception:
+                        pass  # page/target already gone (crashed or closed)
+
+# --------------------------------------------------------
+# HTML parsing: selectolax (C) when available, else BS4
+# --------------------------------------------------------
+def parse_html(html):
+    if HTMLParser is not None:
+        return HTMLParser(html)
+    return BeautifulSoup(html, "html.parser")
+
+def page_title(tree):
+    if HTMLParser is not None:
+        node = tree.css_first("title")
+        return node.text(strip=True) if node else None
+    tag = tree.find("title")
+    return tag.get_text(strip=True) if tag else None
+
+def paragraph_texts(tree):
+    if HTMLParser is not None:
+        return [node.text(strip=True) for node in tree.css("p")]
+    return [p.get_text(strip=True) for p in tree.find_all("p")]
+
+def attribute_values(tree, tag, attr):
+    if HTMLParser is not None:
+        values = (node.attributes.get(attr) for node in tree.css(f"{tag}[{attr}]"))
+        return [v for v in values if v is not None]
+    return [el[attr] for el in tree.find_all(tag, attrs={attr: True})]
 
 # --------------------------------------------------------
 # Extract text from image (OCR)
@@ -58,113 +141,176 @@ def extract_text_from_image(img_bytes):
 # --------------------------------------------------------
 # Extract all valid links
 # --------------------------------------------------------
-def extract_links(base_url, soup):
-    links = set()
-    for a in soup.find_all("a", href=True):
-        url = urljoin(base_url, a["href"])
+def normalize_url(url):
+    # Drop #fragments and lowercase the host so the same page isn't queued twice
+    url, _ = urldefrag(url)
+    parts = urlsplit(url)
+    return parts._replace(netloc=parts.netloc.lower()).geturl()
+
+def extract_links(base_url, tree):
+    # dict as an insertion-ordered set: links keep page order
+    links = {}
+    for href in attribute_values(tree, "a", "href"):
+        url = urljoin(base_url, href)
         if url.startswith("http"):
-            links.add(url)
+            links[normalize_url(url)] = None
     return links
 
 # --------------------------------------------------------
 # Scrape single page using Playwright HTML
+# Returns (filepath, links) so the caller can queue the next
+# level without fetching or parsing the page again.
 # --------------------------------------------------------
-def scrape_article(url, keywords=None, ocr_images=False, log_signal=None):
-    if not os.path.exists(SAVE_DIR):
-        os.makedirs(SAVE_DIR)
-
-    html = fetch_page_playwright(url, log_signal)
+async def scrape_article(pool, url, keywords=None, ocr_images=False, log_signal=None, pending=None):
+    html = await pool.fetch(url, log_signal)
     if not html:
-        return None
+        return None, None
 
-    soup = BeautifulSoup(html, "html.parser")
+    # Parsing, OCR and disk I/O block, so keep them off the event loop
+    return await asyncio.to_thread(
+        save_article, url, html, ocr_images=ocr_images, log_signal=log_signal, pending=pending
+    )
+
+def save_article(url, html, ocr_images=False, log_signal=None, pending=None):
+    # Returns (filepath or None, links found on the page)
+    tree = parse_html(html)
+    links = extract_links(url, tree)
 
     # Create filename
-    title_tag = soup.find("title")
-    title = title_tag.get_text(strip=True) if title_tag else "untitled"
-    filename = f"{safe_filename(title)}_{get_timestamp()}.txt"
+    title = page_title(tree)
+    if title is None:
+        title = "untitled"
+    ts = get_timestamp()
+    # Pages load concurrently and often share a <title>; the URL hash keeps
+    # two of them saved in the same second from overwriting each other
+    url_hash = hashlib.sha1(url.encode("utf-8")).hexdigest()[:8]
+    filename = f"{safe_filename(title)}_{ts}_{url_hash}.txt"
     filepath = os.path.join(SAVE_DIR, filename)
 
     # Extract article paragraphs
-    paragraphs = soup.find_all("p")
-    text_content = "\n".join(
-        p.get_text(strip=True) for p in paragraphs if p.get_text(strip=True)
-    )
+    texts = [t for t in paragraph_texts(tree) if t]
+    text_content = "\n".join(texts)
 
     result_text = (
-        f"Title: {title}\nURL: {url}\nTimestamp: {get_timestamp()}\n\n"
+        f"Title: {title}\nURL: {url}\nTimestamp: {ts}\n\n"
         f"ARTICLE TEXT:\n{text_content}\n\n"
     )
 
     # OCR on images
+    img_texts = []
     if ocr_images:
-        img_texts = []
-        for img in soup.find_all("img", src=True):
-            src = img["src"]
-            src = urljoin(url, src)
+        srcs = [urljoin(url, src) for src in attribute_values(tree, "img", "src")]
 
-            try:
-                img_resp = requests.get(src, timeout=10)
-                img_text = extract_text_from_image(img_resp.content)
+        # Downloads run concurrently; each OCR job is queued as soon as its
+        # image arrives. Tesseract runs as a subprocess, so threads are
+        # enough to keep several cores busy.
+        with ThreadPoolExecutor(max_workers=OCR_WORKERS) as executor:
+            downloads = {executor.submit(SESSION.get, src, timeout=10): src for src in dict.fromkeys(srcs)}
+            ocr_jobs = {}
+            for future in as_completed(downloads):
+                src = downloads[future]
+                try:
+                    img_bytes = future.result().content
+                except Exception as e:
+                    warn = f"[WARNING] OCR failed for {src}: {e}\n"
+                    log_signal.emit(warn) if log_signal else print(warn)
+                    continue
+                ocr_jobs[src] = executor.submit(extract_text_from_image, img_bytes)
+
+            # Report in page order, whatever order the jobs finished in
+            for src in downloads.values():
+                if src not in ocr_jobs:
+                    continue
+                img_text = ocr_jobs[src].result()
                 if img_text:
                     img_texts.append(f"Image text from {src}:\n{img_text}\n")
-            except Exception as e:
-                warn = f"[WARNING] OCR failed for {src}: {e}\n"
-                log_signal.emit(warn) if log_signal else print(warn)
 
         if img_texts:
             result_text += "IMAGE TEXTS:\n" + "\n".join(img_texts)
 
-    # Save text
-    with open(filepath, "w", encoding="utf-8") as f:
-        f.write(result_text)
+    # Nothing worth keeping; don't leave an empty file behind
+    if not texts and not img_texts:
+        msg = f"[INFO] No text found on {url}, nothing saved\n"
+        log_signal.emit(msg) if log_signal else print(msg)
+        return None, links
+
+    # Save text in the background; the caller waits on `pending` at the end
+    def on_written(future):
+        if future.exception():
+            msg = f"[ERROR] Could not save {filepath}: {future.exception()}\n"
+        else:
+            msg = f"[INFO] Saved article text to {filepath}\n"
+        log_signal.emit(msg) if log_signal else print(msg)
 
-    msg = f"[INFO] Saved article text to {filepath}\n"
-    log_signal.emit(msg) if log_signal else print(msg)
+    future = _IO_POOL.submit(write_text_to_file, result_text, filename)
+    future.add_done_callback(on_written)
+    if pending is not None:
+        pending.append(future)
 
-    return filepath
+    return filepath, links
 
 # --------------------------------------------------------
 # Crawl with depth
 # --------------------------------------------------------
 def run_scraper(start_url, keywords=None, depth=1, ocr_images=False, log_signal=None):
+    pending = []
+    try:
+        return asyncio.run(
+            _crawl(start_url, keywords=keywords, depth=depth,
+                   ocr_images=ocr_images, log_signal=log_signal, pending=pending)
+        )
+    finally:
+        # Don't report the crawl as done until every file is on disk
+        wait(pending)
+
+async def _crawl(start_url, keywords=None, depth=1, ocr_images=False, log_signal=None, pending=None):
     visited = set()
-    to_visit = [start_url]
+    to_visit = [normalize_url(start_url)]
     total_files = 0
 
-    for level in range(depth):
-        if log_signal:
-            log_signal.emit(f"[INFO] Crawl Level {level + 1}/{depth}\n")
+    async with PlaywrightPool() as pool:
+        for level in range(depth):
+            if log_signal:
+                log_signal.emit(f"[INFO] Crawl Level {level + 1}/{depth}\n")
 
-        next_links = []
+            # Never schedule more pages than the safety limit allows
+            batch = to_visit[:PAGE_LIMIT - total_files]
+            visited.update(batch)
 
-        for url in to_visit:
-            if url in visited:
-                continue
-            visited.add(url)
-
-            saved_file = scrape_article(
-                url, keywords=keywords, ocr_images=ocr_images, log_signal=log_signal
-            )
-
-            if saved_file:
-                total_files += 1
+            results = await asyncio.gather(*(
+                scrape_article(
+                    pool, url, keywords=keywords,
+                    ocr_images=ocr_images, log_signal=log_signal, pending=pending
+                )
+                for url in batch
+            ), return_exceptions=True)
 
-            # Fetch page HTML for link extraction
-            html = fetch_page_playwright(url, log_signal)
-            if not html:
-                continue
+            # Ordered frontier: the per-level cap keeps the first-discovered
+            # links, so the same crawl visits the same pages every run
+            next_links = {}
+            for url, result in zip(batch, results):
+                # One broken page must not abort the crawl (or close the
+                # browser under its siblings); log it and move on
+                if isinstance(result, Exception):
+                    msg = f"[ERROR] Scraping {url} failed: {result}\n"
+                    log_signal.emit(msg) if log_signal else print(msg)
+                    continue
+                saved_file, links = result
+                if saved_file:
+                    total_files += 1
+                if not links:
+                    continue
 
-            soup = BeautifulSoup(html, "html.parser")
-            links = extract_links(url, soup)
-            next_links.extend(list(links))
+                for link in links:
+                    if link not in visited:
+                        next_links[link] = None
 
             # Safety limit
-            if total_files >= 50:
+            if total_files >= PAGE_LIMIT:
                 if log_signal:
-                    log_signal.emit("[INFO] Page limit (50) reached.\n")
+                    log_signal.emit(f"[INFO] Page limit ({PAGE_LIMIT}) reached.\n")
                 return total_files
 
-        to_visit = next_links
+            to_visit = list(islice(next_links, MAX_PER_LEVEL))
 
     return total_files
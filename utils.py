@@ -1,4 +1,7 @@
+import json
 import os
+import tempfile
+from collections import Counter
 from datetime import datetime
 
 SAVE_DIR = "scraped_txt"
@@ -6,17 +9,87 @@ SAVE_DIR = "scraped_txt"
 def get_timestamp():
     return datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
 
+class _FilenameTable(dict):
+    # str.translate table: allowed characters map to themselves, anything
+    # else to "_". Filled on first sight of each code point.
+    def __missing__(self, code):
+        c = chr(code)
+        self[code] = code if c.isalnum() or c in " -_." else ord("_")
+        return self[code]
+
+_FILENAME_TABLE = _FilenameTable()
+
 def safe_filename(name):
-    return "".join(c if c.isalnum() or c in " -_." else "_" for c in name)[:100]
+    return name[:100].translate(_FILENAME_TABLE)
+
+_TOKEN_SENTINEL = "\x00"
+
+class _TokenTable(dict):
+    # str.translate table: ASCII letters -> lowercase, other word characters
+    # (digits, "_", non-ASCII letters) -> sentinel, everything else -> space.
+    # Tokens containing the sentinel are dropped, so "café" or "abc123" are
+    # skipped whole instead of being cut into "caf" / "abc".
+    def __missing__(self, code):
+        c = chr(code)
+        if c.isascii() and c.isalpha():
+            value = ord(c.lower())
+        elif c.isalnum() or c == "_":
+            value = ord(_TOKEN_SENTINEL)
+        else:
+            value = ord(" ")
+        self[code] = value
+        return value
+
+_TOKEN_TABLE = _TokenTable()
+
+def tokenize(text):
+    # Single C-level translate pass instead of a regex scan over the whole text
+    return [t for t in text.translate(_TOKEN_TABLE).split() if _TOKEN_SENTINEL not in t]
+
+_INDEX_VERSION = 1   # bump when tokenize() changes
+
+def build_token_index(path):
+    # Token counts for a scraped file. Files inside SAVE_DIR get a JSON
+    # sidecar (<file>.idx) that is rebuilt whenever the file's mtime
+    # changes; files picked from anywhere else are just tokenized.
+    directory = os.path.dirname(os.path.abspath(path))
+    if directory != os.path.abspath(SAVE_DIR):
+        with open(path, "r", encoding="utf-8") as f:
+            return Counter(tokenize(f.read()))
+
+    idx_path = path + ".idx"
+    mtime = os.stat(path).st_mtime
+    try:
+        with open(idx_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if index["version"] == _INDEX_VERSION and index["mtime"] == mtime:
+            return Counter(index["counts"])
+    except Exception:
+        pass  # missing, stale-format or unreadable index; rebuild it
+
+    with open(path, "r", encoding="utf-8") as f:
+        counts = Counter(tokenize(f.read()))
+
+    # Unique temp file per writer: the table scan, the AI tab and search
+    # may rebuild the same index at once
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".idx.tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"version": _INDEX_VERSION, "mtime": mtime, "counts": counts}, f)
+        os.replace(tmp_path, idx_path)
+    except OSError:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return counts
 
 def ensure_directory_exists(directory=SAVE_DIR):
-    if not os.path.exists(directory):
-        os.makedirs(directory)
+    os.makedirs(directory, exist_ok=True)
 
 def write_text_to_file(text, filename, directory=SAVE_DIR):
     ensure_directory_exists(directory)
     filepath = os.path.join(directory, filename)
-    with open(filepath, "w", encoding="utf-8") as f:
+    with open(filepath, "w", encoding="utf-8", buffering=1 << 20) as f:
         f.write(text)
     return filepath
 